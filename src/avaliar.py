@@ -7,12 +7,15 @@ Uso:
     python -m src.avaliar --modo standard [--arquivo nome.json]
 """
 
-import json
+import io
+import os
 import sys
 import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import TextIO
 
 from .config import (
     OPENAI_API_KEY,
@@ -24,19 +27,28 @@ from .config import (
     MODE_FLEX,
     MODE_BATCH,
     MODE_STANDARD,
+    MAX_CONCURRENCY,
     DATA_DIR,
     calculate_cost,
     BATCH_POLL_INTERVAL,
+    BATCH_POLL_MAX_INTERVAL,
     USD_TO_BRL,
 )
+from . import jsonio
+from .cache import cache_key, get_verdict_cache
 from .evaluate import (
     load_gabarito,
     load_system_prompt,
     load_response_file,
-    evaluate_file,
-    compute_summary,
+    index_gabarito,
+    build_user_prompt,
+    evaluate_l1_batch,
+    submit_file_tasks,
+    collect_file_results,
+    compute_summaries,
 )
 from .llm import (
+    build_batch_line,
     upload_batch_file,
     create_batch,
     poll_batch,
@@ -44,185 +56,299 @@ from .llm import (
 )
 
 
+# ============================================================
+# OUTPUT HELPERS
+# ============================================================
+
+def print_file_summary(file_id: str, summary: dict) -> None:
+    """Imprime o sumário por nível de um arquivo avaliado (uma única escrita no stdout)."""
+    lines = [f"\n  📊 {file_id}:\n"]
+    for level, stats in summary.items():
+        pct = f"{stats['rate']:.0%}"
+        lines.append(f"     {level}: {stats['success']}/{stats['evaluated']} ({pct})\n")
+    sys.stdout.write("".join(lines))
+
+
+def write_file_block(just_file: TextIO, file_id: str, justificativas: list) -> None:
+    """Grava a seção de um arquivo no Markdown de justificativas, de uma só vez."""
+    just_file.writelines(f"{line}\n" for line in [f"\n## {file_id}\n", *justificativas])
+
+
 # ============================================================
 # BATCH MODE HELPERS
 # ============================================================
 
+# Sentinela para "task sem resultado no batch" (None já significa falha na linha)
+_MISSING = object()
+
+# Separador file_id/task_id no custom_id das linhas do batch (prepare_batch ↔ process_batch_results)
+_SEP = "::"
+
+def _prepare_file(
+    file_path: Path,
+    gabarito: dict,
+    index: dict,
+) -> tuple[str, dict, list, list]:
+    """
+    Lê um arquivo de respostas e separa suas tasks para o batch.
+    Roda em thread de prepare_batch; não escreve em disco nem no stdout.
+    
+    Returns:
+        (file_id, responses, l1_pairs, prompt_jobs)
+        - l1_pairs: [(task_id, resposta, gabarito)] a avaliar localmente
+        - prompt_jobs: [(task_id, gab_entry, resposta)] L2-L4 (prompt montado em prepare_batch)
+    """
+    data = load_response_file(file_path)
+    file_id = data["metadata"]["id"]
+    responses = data["responses"]
+    
+    answers = index["answer"]
+    l1_ids = index["l1_ids"]
+    l2_ids = index["l2_ids"]
+    
+    # L1: avaliar localmente (em lote, em prepare_batch)
+    l1_pairs = [
+        (task_id, response_text, answers[task_id])
+        for task_id, response_text in responses.items()
+        if task_id in l1_ids
+    ]
+    
+    # L2-L4: prompt montado em lote, em prepare_batch
+    prompt_jobs = [
+        (task_id, gabarito[task_id], response_text)
+        for task_id, response_text in responses.items()
+        if task_id in l2_ids
+    ]
+    
+    return file_id, responses, l1_pairs, prompt_jobs
+
+
 def prepare_batch(
     response_files: list[Path],
     gabarito: dict,
     system_prompt: str,
-) -> tuple[Path, Path, dict]:
+    keep_temp: bool = False,
+    use_cache: bool = True,
+) -> tuple[bytes, dict, dict, dict, dict, dict]:
     """
-    Prepara batch: gera JSONL + avalia L1 localmente.
+    Prepara batch: gera JSONL em memória + avalia L1 localmente.
+    Tasks L2-L4 já presentes no cache de veredictos não entram no JSONL, e
+    prompts idênticos (mesma chave de cache) viram uma única linha.
+    Os arquivos são lidos em paralelo (_prepare_file); os prompts são
+    montados e o JSONL é escrito sequencialmente, na ordem de response_files.
+    Com keep_temp, JSONL e L1 também são gravados em data/ para depuração.
+    Com use_cache=False nenhuma task é lida do cache (todas vão ao batch).
     
     Returns:
-        (jsonl_path, l1_results_path, l1_results_dict)
+        (jsonl_bytes, l1_results_dict, responses_by_file, cached_results, cache_keys, dup_map)
+        - responses_by_file: {file_id: {task_id: resposta}}, lido uma única vez
+        - cached_results: {file_id: {task_id: resultado}} vindos do cache
+        - cache_keys: {custom_id: chave do cache} das tasks enviadas ao batch
+        - dup_map: {custom_id duplicado: custom_id enviado com o mesmo prompt}
     """
-    from .llm import build_batch_line
-    from .evaluate import build_user_prompt, evaluate_l1
-    
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    jsonl_path = DATA_DIR / f"batch_{timestamp}.jsonl"
-    l1_path = DATA_DIR / f"batch_l1_{timestamp}.json"
+    cache = get_verdict_cache()
     
-    batch_lines = []
+    n_batch = 0
     l1_results = {}
+    l1_pairs = []  # (file_id, task_id, resposta, gabarito) — avaliados em lote ao final
+    prompt_jobs = []  # (task_id, gab_entry, resposta) de todos os arquivos
+    prompt_owners = []  # file_id de cada item de prompt_jobs
+    responses_by_file = {}
+    cached_results = {}
+    cache_keys = {}
+    seen = {}  # chave do cache → primeiro custom_id com esse prompt
+    dup_map = {}
     
     print("\n📝 Preparando batch...")
     
-    for file_path in response_files:
-        data = load_response_file(file_path)
-        file_id = data["metadata"]["id"]
-        responses = data["responses"]
+    index = index_gabarito(gabarito)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        prepared = executor.map(
+            lambda file_path: _prepare_file(file_path, gabarito, index),
+            response_files,
+        )
+        for file_id, responses, file_l1_pairs, file_jobs in prepared:
+            responses_by_file[file_id] = responses
+            l1_results[file_id] = {}
+            cached_results[file_id] = {}
+            l1_pairs.extend((file_id, *pair) for pair in file_l1_pairs)
+            prompt_jobs.extend(file_jobs)
+            prompt_owners.extend([file_id] * len(file_jobs))
+    
+    user_prompts = [build_user_prompt(*job) for job in prompt_jobs]
+    
+    # JSONL montado em memória, na ordem dos arquivos (vai direto para o upload)
+    jsonl_buffer = io.BytesIO()
+    for file_id, (task_id, _, _), user_prompt in zip(prompt_owners, prompt_jobs, user_prompts):
+        key = cache_key(system_prompt, user_prompt, OPENAI_MODEL)
+        cached = cache.get(key) if use_cache else None
+        if cached is not None:
+            cached_results[file_id][task_id] = cached
+            continue
         
-        l1_results[file_id] = {}
+        custom_id = f"{file_id}{_SEP}{task_id}"
+        if key in seen:
+            dup_map[custom_id] = seen[key]
+            continue
         
-        for task_id, response_text in responses.items():
-            if task_id not in gabarito:
-                continue
-            
-            gab = gabarito[task_id]
-            level = gab["level"]
-            
-            # L1: avaliar localmente
-            if level == 1:
-                verdict = evaluate_l1(response_text, gab["answer"])
-                l1_results[file_id][task_id] = verdict
-                print(f"  ✓ {file_id} — {task_id}: L1 local")
-            
-            # L2-L4: adicionar ao batch
-            else:
-                user_prompt = build_user_prompt(task_id, gab, response_text)
-                custom_id = f"{file_id}::{task_id}"
-                line = build_batch_line(custom_id, system_prompt, user_prompt)
-                batch_lines.append(line)
-    
-    # Salvar JSONL
-    with open(jsonl_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(batch_lines))
-    
-    # Salvar L1 results
-    with open(l1_path, "w", encoding="utf-8") as f:
-        json.dump(l1_results, f, indent=2)
-    
-    print(f"  ✅ {len(batch_lines)} tasks no batch")
-    print(f"  ✅ {sum(len(tasks) for tasks in l1_results.values())} tasks L1 locais")
-    print(f"  📄 {jsonl_path}")
-    print(f"  📄 {l1_path}")
-    
-    return jsonl_path, l1_path, l1_results
+        seen[key] = custom_id
+        cache_keys[custom_id] = key
+        jsonl_buffer.write(build_batch_line(custom_id, system_prompt, user_prompt).encode("utf-8"))
+        jsonl_buffer.write(b"\n")
+        n_batch += 1
+    jsonl_bytes = jsonl_buffer.getvalue()
+    
+    verdicts = evaluate_l1_batch([(resp, correct) for _, _, resp, correct in l1_pairs])
+    for (file_id, task_id, _, _), verdict in zip(l1_pairs, verdicts):
+        l1_results[file_id][task_id] = verdict
+    
+    print(f"  ✅ {n_batch} tasks no batch")
+    print(f"  ✅ {len(dup_map)} tasks duplicadas (reaproveitam outra linha do batch)")
+    print(f"  ✅ {sum(len(tasks) for tasks in cached_results.values())} tasks L2-L4 do cache")
+    print(f"  ✅ {len(l1_pairs)} tasks L1 locais")
+    
+    # Cópias em disco só para depuração (--keep-temp)
+    if keep_temp:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        jsonl_path = DATA_DIR / f"batch_{timestamp}.jsonl"
+        l1_path = DATA_DIR / f"batch_l1_{timestamp}.json"
+        jsonl_path.write_bytes(jsonl_bytes)
+        jsonio.dump_file(l1_results, l1_path)
+        print(f"  📄 {jsonl_path}")
+        print(f"  📄 {l1_path}")
+    
+    return jsonl_bytes, l1_results, responses_by_file, cached_results, cache_keys, dup_map
 
 
 def process_batch_results(
     batch_results: list[dict],
     l1_results: dict,
     gabarito: dict,
-) -> tuple[dict, list, dict]:
+    responses_by_file: dict,
+    cached_results: dict,
+    dup_map: dict,
+    just_file: TextIO,
+) -> tuple[dict, dict]:
     """
-    Processa resultados do batch + L1 locais.
+    Processa resultados do batch + L1 locais + acertos do cache.
+    As justificativas de cada arquivo são gravadas direto em just_file.
     
     Args:
         batch_results: Lista de dicts com custom_id, result, usage
         l1_results: Dict {file_id: {task_id: verdict}}
         gabarito: Dict do gabarito
+        responses_by_file: Dict {file_id: {task_id: resposta}} (de prepare_batch)
+        cached_results: Dict {file_id: {task_id: resultado}} (de prepare_batch, sem custo)
+        dup_map: Dict {custom_id duplicado: custom_id enviado} (de prepare_batch, sem custo)
+        just_file: Markdown de justificativas aberto para escrita
     
     Returns:
-        (all_results, all_justificativas, cost_info)
+        (all_results, cost_info)
     """
-    # Organizar batch results por arquivo
-    batch_by_file = {}
-    total_prompt_tokens = 0
-    total_completion_tokens = 0
-    api_calls = 0
+    # Organizar batch results por arquivo (acertos do cache entram sem custo)
+    batch_by_file = {file_id: dict(cached) for file_id, cached in cached_results.items()}
     
+    results_by_id = {}
     for item in batch_results:
         custom_id = item["custom_id"]
-        file_id, task_id = custom_id.split("::")
+        file_id, sep, task_id = custom_id.partition(_SEP)
+        if not sep:
+            print(f"⚠️  custom_id inválido: {custom_id}")
+            continue
         
         if file_id not in batch_by_file:
             batch_by_file[file_id] = {}
         
         batch_by_file[file_id][task_id] = item["result"]
-        
-        # Acumular tokens
-        total_prompt_tokens += item["usage"]["prompt_tokens"]
-        total_completion_tokens += item["usage"]["completion_tokens"]
-        api_calls += 1
+        results_by_id[custom_id] = item["result"]
+    
+    # Replicar o resultado de cada linha enviada para as tasks duplicadas
+    for dup_id, first_id in dup_map.items():
+        if first_id in results_by_id:
+            file_id, sep, task_id = dup_id.partition(_SEP)
+            if not sep:
+                print(f"⚠️  custom_id inválido: {dup_id}")
+                continue
+            batch_by_file.setdefault(file_id, {})[task_id] = results_by_id[first_id]
     
     # Combinar L1 + batch results
     all_results = {}
-    all_justificativas = []
+    answers = index_gabarito(gabarito)["answer"]
     
     # Processar cada arquivo
-    for file_id in l1_results.keys():
+    for file_id, file_l1 in l1_results.items():
         tasks = {}
         justificativas = []
+        responses = responses_by_file[file_id]
         
         # Adicionar L1 results
-        for task_id, verdict in l1_results[file_id].items():
+        for task_id, verdict in file_l1.items():
             tasks[task_id] = verdict
-            gab = gabarito[task_id]
-            r = load_response_file(RESPOSTAS_DIR / f"{file_id}.json")["responses"][task_id].strip().upper()
-            c = gab["answer"].strip().upper()
+            r = responses[task_id].strip().upper()
+            c = answers[task_id].strip().upper()
             
             if verdict:
                 justificativas.append(f"✓ {task_id} — '{r}' = '{c}'")
             else:
                 justificativas.append(f"✗ {task_id} — '{r}' ≠ '{c}'")
         
-        # Adicionar batch results
-        if file_id in batch_by_file:
-            for task_id, result in batch_by_file[file_id].items():
-                if result is None:
-                    tasks[task_id] = 0
-                    justificativas.append(
-                        f"\n### {file_id} — {task_id}\n"
-                        f"- ERRO: falha no batch\n"
-                        f"- **Veredicto: 0** (erro)\n"
-                    )
-                    continue
+        # Adicionar batch results (na ordem original das respostas)
+        file_batch = batch_by_file.get(file_id, {})
+        for task_id in responses:
+            result = file_batch.get(task_id, _MISSING)
+            if result is _MISSING:
+                continue
+            
+            if result is None:
+                tasks[task_id] = 0
+                justificativas.append(
+                    f"\n### {file_id} — {task_id}\n"
+                    f"- ERRO: falha no batch\n"
+                    f"- **Veredicto: 0** (erro)\n"
+                )
+                continue
+            
+            verdict = result.get("verdict", 0)
+            tasks[task_id] = verdict
+            
+            if verdict == 1:
+                justificativas.append(f"✓ {task_id} — all criteria met")
+            else:
+                lines = [f"\n### {file_id} — {task_id}"]
+                for c in result.get("criteria", []):
+                    sym = "✓" if c.get("met") else "✗"
+                    evidence = c.get("evidence", "?")
+                    lines.append(f"- C{c.get('id', '?')}: {sym} — {evidence}")
                 
-                verdict = result.get("verdict", 0)
-                tasks[task_id] = verdict
+                hall = result.get("hallucination")
+                if hall:
+                    lines.append(f"- Alucinação: {hall}")
                 
-                if verdict == 1:
-                    justificativas.append(f"✓ {task_id} — all criteria met")
-                else:
-                    lines = [f"\n### {file_id} — {task_id}"]
-                    for c in result.get("criteria", []):
-                        sym = "✓" if c.get("met") else "✗"
-                        evidence = c.get("evidence", "?")
-                        lines.append(f"- C{c.get('id', '?')}: {sym} — {evidence}")
-                    
-                    hall = result.get("hallucination")
-                    if hall:
-                        lines.append(f"- Alucinação: {hall}")
-                    
-                    reason = result.get("fail_reason", "critério ausente")
-                    lines.append(f"- **Veredicto: 0** ({reason})")
-                    justificativas.append("\n".join(lines))
+                reason = result.get("fail_reason", "critério ausente")
+                lines.append(f"- **Veredicto: 0** ({reason})")
+                justificativas.append("\n".join(lines))
         
-        # Computar sumário
-        summary = compute_summary(tasks)
-        all_results[file_id] = {"tasks": tasks, "summary": summary}
-        
-        all_justificativas.append(f"\n## {file_id}\n")
-        all_justificativas.extend(justificativas)
-        
-        # Print sumário
-        print(f"\n  📊 {file_id}:")
-        for level, stats in summary.items():
-            pct = f"{stats['rate']:.0%}"
-            print(f"     {level}: {stats['success']}/{stats['evaluated']} ({pct})")
-    
+        all_results[file_id] = {
+            "tasks": tasks,
+            "cached_tasks": sorted(cached_results.get(file_id, ())),
+        }
+        write_file_block(just_file, file_id, justificativas)
+    
+    # Sumários de todos os arquivos numa única passada
+    summaries = compute_summaries({file_id: r["tasks"] for file_id, r in all_results.items()})
+    for file_id, summary in summaries.items():
+        all_results[file_id]["summary"] = summary
+        print_file_summary(file_id, summary)
+    
+    # Cada linha do batch é uma chamada paga (duplicatas e cache não entram aqui)
     cost_info = {
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_completion_tokens": total_completion_tokens,
-        "api_calls": api_calls,
+        "total_prompt_tokens": sum(item["usage"]["prompt_tokens"] for item in batch_results),
+        "total_completion_tokens": sum(item["usage"]["completion_tokens"] for item in batch_results),
+        "api_calls": len(batch_results),
+        "cached_verdicts": sum(len(r["cached_tasks"]) for r in all_results.values()),
     }
     
-    return all_results, all_justificativas, cost_info
+    return all_results, cost_info
 
 
 # ============================================================
@@ -235,58 +361,65 @@ def run_flex_or_standard_mode(
     gabarito: dict,
     gab_version: str,
     system_prompt: str,
-) -> tuple[dict, list, dict, float]:
+    just_file: TextIO,
+    use_cache: bool = True,
+) -> tuple[dict, dict, float]:
     """
     Executa avaliação em modo flex ou standard.
+    As justificativas de cada arquivo são gravadas direto em just_file.
+    use_cache=False (--no-cache) reavalia todas as tasks L2-L4 na API.
     
     Returns:
-        (all_results, all_justificativas, cost_info, elapsed_time)
+        (all_results, cost_info, elapsed_time)
     """
     service_tier = "flex" if mode == MODE_FLEX else None
     
     all_results = {}
-    all_justificativas = []
     files_evaluated = []
-    total_prompt_tokens = 0
-    total_completion_tokens = 0
-    api_calls = 0
     start_time = time.time()
     
     for file_path in response_files:
-        print(f"\n{'─' * 50}")
         print(f"📄 {file_path.name}")
-        print(f"{'─' * 50}")
-        
-        file_id, tasks, justificativas, token_usage = evaluate_file(
-            file_path, gabarito, system_prompt, service_tier
-        )
+    
+    # Um único pool para as tasks L2-L4 de todos os arquivos (na fila, na ordem dos
+    # arquivos); o teto de requisições em voo e o RPM são globais (llm.py)
+    index = index_gabarito(gabarito)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        try:
+            pending = [
+                submit_file_tasks(
+                    file_path, gabarito, system_prompt, executor, service_tier, index, use_cache
+                )
+                for file_path in response_files
+            ]
+            outcomes = [collect_file_results(p) for p in pending]
+        except BaseException:
+            # Falha num arquivo: descarta as chamadas ainda na fila antes de propagar
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    
+    for file_id, tasks, justificativas, token_usage, cached_tasks in outcomes:
         files_evaluated.append(file_id)
-        
-        # Acumular tokens e calls
-        total_prompt_tokens += token_usage["prompt_tokens"]
-        total_completion_tokens += token_usage["completion_tokens"]
-        api_calls += token_usage["api_calls"]
-        
-        summary = compute_summary(tasks)
-        all_results[file_id] = {"tasks": tasks, "summary": summary}
-        
-        all_justificativas.append(f"\n## {file_id}\n")
-        all_justificativas.extend(justificativas)
-        
-        print(f"\n  📊 {file_id}:")
-        for level, stats in summary.items():
-            pct = f"{stats['rate']:.0%}"
-            print(f"     {level}: {stats['success']}/{stats['evaluated']} ({pct})")
+        all_results[file_id] = {"tasks": tasks, "cached_tasks": cached_tasks}
+        write_file_block(just_file, file_id, justificativas)
+    
+    # Sumários de todos os arquivos numa única passada
+    summaries = compute_summaries({file_id: r["tasks"] for file_id, r in all_results.items()})
+    for file_id, summary in summaries.items():
+        all_results[file_id]["summary"] = summary
+        print_file_summary(file_id, summary)
     
     elapsed = time.time() - start_time
     
+    usages = [token_usage for _, _, _, token_usage, _ in outcomes]
     cost_info = {
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_completion_tokens": total_completion_tokens,
-        "api_calls": api_calls,
+        "total_prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "total_completion_tokens": sum(u["completion_tokens"] for u in usages),
+        "api_calls": sum(u["api_calls"] for u in usages),
+        "cached_verdicts": sum(len(r["cached_tasks"]) for r in all_results.values()),
     }
     
-    return all_results, all_justificativas, cost_info, elapsed
+    return all_results, cost_info, elapsed
 
 
 # ============================================================
@@ -298,46 +431,62 @@ def run_batch_mode(
     gabarito: dict,
     gab_version: str,
     system_prompt: str,
-) -> tuple[dict, list, dict, float, Path, Path]:
+    just_file: TextIO,
+    keep_temp: bool = False,
+    use_cache: bool = True,
+) -> tuple[dict, dict, float]:
     """
     Executa avaliação em modo batch.
+    As justificativas de cada arquivo são gravadas direto em just_file.
+    use_cache=False (--no-cache) envia todas as tasks L2-L4 ao batch.
     
     Returns:
-        (all_results, all_justificativas, cost_info, elapsed_time, jsonl_path, l1_path)
+        (all_results, cost_info, elapsed_time)
     """
     start_time = time.time()
     
     # 1. Preparar batch (gerar JSONL + avaliar L1 localmente)
-    jsonl_path, l1_path, l1_results = prepare_batch(
-        response_files, gabarito, system_prompt
+    jsonl_bytes, l1_results, responses_by_file, cached_results, cache_keys, dup_map = prepare_batch(
+        response_files, gabarito, system_prompt, keep_temp, use_cache
     )
     
-    # 2. Upload
-    print("\n📤 Enviando batch...")
-    file_id = upload_batch_file(str(jsonl_path))
-    
-    # 3. Criar batch
-    print("\n🚀 Criando batch...")
-    batch_id = create_batch(file_id)
-    
-    # 4. Poll até completar
-    print(f"\n⏳ Aguardando conclusão (polling a cada {BATCH_POLL_INTERVAL}s)...")
-    batch = poll_batch(batch_id, interval=BATCH_POLL_INTERVAL)
-    
-    # 5. Download resultados
-    print("\n📥 Baixando resultados...")
-    output_file_id = batch.output_file_id
-    batch_results = download_batch_results(output_file_id)
+    if cache_keys:
+        # 2. Upload
+        print("\n📤 Enviando batch...")
+        file_id = upload_batch_file(jsonl_bytes)
+        
+        # 3. Criar batch
+        print("\n🚀 Criando batch...")
+        batch_id = create_batch(file_id)
+        
+        # 4. Poll até completar
+        print(f"\n⏳ Aguardando conclusão (polling de {BATCH_POLL_INTERVAL}s a {BATCH_POLL_MAX_INTERVAL}s)...")
+        batch = poll_batch(batch_id, interval=BATCH_POLL_INTERVAL, max_interval=BATCH_POLL_MAX_INTERVAL)
+        
+        # 5. Download resultados
+        print("\n📥 Baixando resultados...")
+        output_file_id = batch.output_file_id
+        batch_results = download_batch_results(output_file_id)
+        
+        # Guardar veredictos válidos no cache para as próximas execuções
+        cache = get_verdict_cache()
+        for item in batch_results:
+            key = cache_keys.get(item["custom_id"])
+            if key and item["result"] is not None:
+                cache.put(key, item["result"], item["usage"])
+    else:
+        print("\n♻️  Todas as tasks L2-L4 vieram do cache, batch não enviado")
+        batch_results = []
     
     # 6. Processar resultados
     print("\n📊 Processando resultados...")
-    all_results, all_justificativas, cost_info = process_batch_results(
-        batch_results, l1_results, gabarito
+    all_results, cost_info = process_batch_results(
+        batch_results, l1_results, gabarito, responses_by_file, cached_results, dup_map, just_file
     )
     
     elapsed = time.time() - start_time
     
-    return all_results, all_justificativas, cost_info, elapsed, jsonl_path, l1_path
+    return all_results, cost_info, elapsed
 
 
 # ============================================================
@@ -361,6 +510,16 @@ def main():
         default=None,
         help="Avaliar apenas um arquivo específico (nome do .json em respostas/)",
     )
+    parser.add_argument(
+        "--keep-temp",
+        action="store_true",
+        help="Modo batch: gravar também o JSONL e os resultados L1 em data/ (depuração)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignorar o cache de veredictos e reavaliar tudo na API (o cache é atualizado)",
+    )
     args = parser.parse_args()
     
     mode = args.modo
@@ -395,7 +554,12 @@ def main():
             sys.exit(1)
         response_files = [target]
     else:
-        response_files = sorted(RESPOSTAS_DIR.glob("*.json"))
+        # scandir: DirEntry já traz o tipo do arquivo, sem um stat extra por entrada
+        with os.scandir(RESPOSTAS_DIR) as entries:
+            response_files = sorted(
+                (Path(e.path) for e in entries if e.name.endswith(".json") and e.is_file()),
+                key=lambda p: p.name,
+            )
     
     if not response_files:
         print(f"❌ Nenhum .json em {RESPOSTAS_DIR}/")
@@ -411,23 +575,43 @@ def main():
     print(f"  Arquivos:   {len(response_files)}")
     print(f"{'=' * 60}")
     
-    # --- Executar avaliação ---
-    if mode == MODE_BATCH:
-        all_results, all_justificativas, cost_info, elapsed, jsonl_path, l1_path = run_batch_mode(
-            response_files, gabarito, gab_version, system_prompt
-        )
-    else:
-        all_results, all_justificativas, cost_info, elapsed = run_flex_or_standard_mode(
-            mode, response_files, gabarito, gab_version, system_prompt
-        )
-        jsonl_path = None
-        l1_path = None
+    # --- Executar avaliação (justificativas gravadas em streaming no Markdown) ---
+    started = datetime.now()
+    file_ts = started.strftime("%Y-%m-%d_%H%M%S")
+    just_path = RESULTADOS_DIR / f"justificativas_{file_ts}.md"
+    
+    try:
+        with open(just_path, "w", encoding="utf-8") as just_file:
+            just_file.write(f"# Justificativas — Avaliação {started.strftime('%Y-%m-%d')}\n\n")
+            just_file.write(f"Juiz: {OPENAI_MODEL} | Modo: {mode} | Gabarito v{gab_version}\n")
+            just_file.write(f"Arquivos: {len(response_files)}\n")
+        
+            if mode == MODE_BATCH:
+                all_results, cost_info, elapsed = run_batch_mode(
+                    response_files, gabarito, gab_version, system_prompt, just_file,
+                    args.keep_temp, not args.no_cache,
+                )
+            else:
+                all_results, cost_info, elapsed = run_flex_or_standard_mode(
+                    mode, response_files, gabarito, gab_version, system_prompt, just_file,
+                    not args.no_cache,
+                )
+        
+            just_file.write(
+                f"\nChamadas API: {cost_info['api_calls']} | Do cache: {cost_info['cached_verdicts']}"
+                f" | Tempo: {elapsed / 60:.1f} min\n"
+            )
+    except BaseException:
+        # Sem eval JSON, um Markdown parcial só confundiria: remove antes de propagar
+        just_path.unlink(missing_ok=True)
+        raise
     
     # --- Calcular custo ---
     total_prompt_tokens = cost_info["total_prompt_tokens"]
     total_completion_tokens = cost_info["total_completion_tokens"]
     total_tokens = total_prompt_tokens + total_completion_tokens
     api_calls = cost_info["api_calls"]
+    cached_verdicts = cost_info["cached_verdicts"]
     
     cost_mode = "batch" if mode == MODE_BATCH else "standard"
     estimated_cost = calculate_cost(
@@ -437,9 +621,7 @@ def main():
     estimated_cost_brl = estimated_cost["brl"]
     
     # --- Salvar outputs ---
-    now = datetime.now()
-    timestamp = now.strftime("%Y-%m-%dT%H:%M:%S")
-    file_ts = now.strftime("%Y-%m-%d_%H%M%S")
+    timestamp = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
     
     files_evaluated = list(all_results.keys())
     
@@ -457,6 +639,7 @@ def main():
             "total_completion_tokens": total_completion_tokens,
             "total_tokens": total_tokens,
             "api_calls": api_calls,
+            "cached_verdicts": cached_verdicts,  # veredictos L2-L4 reaproveitados (sem chamada)
             "estimated_cost_usd": round(estimated_cost_usd, 4),
             "estimated_cost_brl": estimated_cost_brl,
             "usd_to_brl_rate": USD_TO_BRL,
@@ -464,19 +647,7 @@ def main():
         "results": all_results,
     }
     eval_path = RESULTADOS_DIR / f"eval_{file_ts}.json"
-    with open(eval_path, "w", encoding="utf-8") as f:
-        json.dump(eval_output, f, ensure_ascii=False, indent=2)
-    
-    # Markdown
-    just_path = RESULTADOS_DIR / f"justificativas_{file_ts}.md"
-    with open(just_path, "w", encoding="utf-8") as f:
-        f.write(f"# Justificativas — Avaliação {now.strftime('%Y-%m-%d')}\n\n")
-        f.write(f"Juiz: {OPENAI_MODEL} | Modo: {mode} | Gabarito v{gab_version}\n")
-        f.write(f"Arquivos: {len(files_evaluated)} | ")
-        f.write(f"Chamadas API: {api_calls} | ")
-        f.write(f"Tempo: {elapsed / 60:.1f} min\n")
-        f.write("\n".join(all_justificativas))
-        f.write("\n")
+    jsonio.dump_file(eval_output, eval_path)
     
     # --- Print sumário final ---
     print(f"\n{'=' * 60}")
@@ -485,6 +656,7 @@ def main():
     print(f"     Modelo juiz:    {OPENAI_MODEL}")
     print(f"     Arquivos:       {len(files_evaluated)}")
     print(f"     Chamadas API:   {api_calls}")
+    print(f"     Do cache:       {cached_verdicts}")
     print(f"     Tokens:         {total_prompt_tokens//1000}K prompt + {total_completion_tokens//1000}K completion = {total_tokens//1000}K total")
     brl_display = f"{estimated_cost_brl:.2f}".replace(".", ",")
     print(f"     Custo estimado: ${estimated_cost_usd:.4f} (R$ {brl_display})")
@@ -492,15 +664,6 @@ def main():
     print(f"     📄 {eval_path}")
     print(f"     📄 {just_path}")
     print(f"{'=' * 60}\n")
-    
-    # --- Limpeza (batch mode) ---
-    if mode == MODE_BATCH and jsonl_path and l1_path:
-        try:
-            jsonl_path.unlink()
-            l1_path.unlink()
-            print(f"🧹 Arquivos temporários removidos")
-        except Exception as e:
-            print(f"⚠️  Erro ao remover arquivos temporários: {e}")
 
 
 if __name__ == "__main__":
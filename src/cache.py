@@ -0,0 +1,80 @@
+"""Cache persistente de veredictos do juiz (SQLite), chaveado pelo conteúdo do prompt."""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from . import jsonio
+from .config import JUDGE_CACHE_PATH, JUDGE_TEMPERATURE
+
+
+def cache_key(
+    system_prompt: str,
+    user_prompt: str,
+    model: str,
+    temperature: float = JUDGE_TEMPERATURE,
+) -> str:
+    """Hash de (model, temperature, system_prompt, user_prompt) que identifica uma avaliação."""
+    payload = "\x00".join((model, str(temperature), system_prompt, user_prompt))
+    return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Tabela `verdicts(key, verdict, result, usage)` em SQLite.
+
+    Uma única conexão compartilhada entre threads (protegida por lock),
+    com journal WAL para não bloquear leituras durante as escritas.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, verdict INTEGER, result TEXT, usage TEXT)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> dict | None:
+        """Retorna o resultado do juiz (JSON parseado) ou None se ausente."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else jsonio.loads(row[0])
+
+    def put(self, key: str, result: dict, usage: dict) -> None:
+        """Grava (ou substitui) o resultado de uma avaliação bem-sucedida."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, result, usage) VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    result.get("verdict", 0),
+                    jsonio.dumps(result).decode("utf-8"),
+                    jsonio.dumps(usage).decode("utf-8"),
+                ),
+            )
+            self.conn.commit()
+
+
+_verdict_cache: VerdictCache | None = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> VerdictCache:
+    """
+    Instância única do cache (aberta na primeira utilização).
+    Criação protegida por lock: as primeiras chamadas chegam em paralelo dos pools
+    de threads e cada VerdictCache extra abriria sua própria conexão.
+    """
+    global _verdict_cache
+    if _verdict_cache is None:
+        with _verdict_cache_lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache(JUDGE_CACHE_PATH)
+    return _verdict_cache
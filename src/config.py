@@ -13,12 +13,10 @@ except ImportError:
 load_dotenv()
 
 # --- OpenAI API ---
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    print("ERRO: OPENAI_API_KEY não encontrada no .env")
-    sys.exit(1)
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # validada em avaliar.main(), não no import
 
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+JUDGE_TEMPERATURE = 0  # determinístico: mesmo prompt → mesmo veredicto (base do cache)
 
 # --- Constantes de modo ---
 MODE_FLEX = "flex"
@@ -42,8 +40,13 @@ PRICING = {
 # --- Câmbio ---
 USD_TO_BRL = 5.20  # Atualizar manualmente quando necessário
 
+# --- Concorrência (modos flex/standard) ---
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))  # requisições por minuto do tier da conta
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))  # chamadas simultâneas à API
+
 # --- Batch API config ---
-BATCH_POLL_INTERVAL = 30  # segundos entre polls
+BATCH_POLL_INTERVAL = 10  # segundos — intervalo inicial/mínimo entre polls
+BATCH_POLL_MAX_INTERVAL = 300  # segundos — teto do backoff entre polls
 BATCH_COMPLETION_WINDOW = "24h"
 BATCH_ENDPOINT = "/v1/chat/completions"
 
@@ -55,6 +58,7 @@ GABARITO_PATH = DATA_DIR / "gabarito.json"
 RESPOSTAS_DIR = DATA_DIR / "respostas"
 RESULTADOS_DIR = DATA_DIR / "resultados"
 PROMPT_PATH = DATA_DIR / "prompt_juiz.txt"
+JUDGE_CACHE_PATH = Path(os.getenv("JUDGE_CACHE_PATH", DATA_DIR / "judge_cache.sqlite"))
 
 
 # --- Funções utilitárias ---
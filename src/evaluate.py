@@ -1,33 +1,95 @@
 """Lógica de avaliação: L1 local, L2-L4 via API."""
 
-import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+from . import jsonio
+from .config import MAX_CONCURRENCY
 from .llm import call_openai, build_batch_line
 
+try:
+    import ijson  # opcional: leitura em streaming de gabaritos grandes
+except ImportError:
+    ijson = None
+
+# Acima deste tamanho (bytes) o gabarito é lido em streaming, se ijson estiver instalado
+GABARITO_STREAM_THRESHOLD = 1_000_000
+
+# Separador file_id/task_id no custom_id das linhas do batch (prepare_batch ↔ process_batch_results)
+_SEP = "____"
+
+# Intervalo mínimo (s) entre escritas das linhas de progresso L2-L4 no stdout
+PROGRESS_INTERVAL = 1.0
+
 
 # ============================================================
 # CARREGAMENTO
 # ============================================================
 
 def load_gabarito(path: Path) -> tuple[dict, str]:
-    """Carrega gabarito. Retorna (tasks_dict, version)."""
-    with open(path, encoding="utf-8") as f:
-        data = json.load(f)
+    """Carrega gabarito. Retorna (tasks_dict, version). Cacheado por (caminho, mtime)."""
+    stat = path.stat()
+    return _load_gabarito(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4)
+def _load_gabarito(path: str, mtime_ns: int, size: int) -> tuple[dict, str]:
+    if ijson is not None and size > GABARITO_STREAM_THRESHOLD:
+        return _stream_gabarito(Path(path))
+    data = jsonio.load_file(Path(path))
     version = data.get("version", "?")
     tasks = {k: v for k, v in data.items() if k.startswith("L")}
     return tasks, version
 
 
+def _stream_gabarito(path: Path) -> tuple[dict, str]:
+    """Lê o gabarito chave a chave (ijson), montando só as tasks L*; sem o dict intermediário."""
+    tasks = {}
+    version = "?"
+    with open(path, "rb") as f:
+        for key, value in ijson.kvitems(f, "", use_float=True):
+            if key == "version":
+                version = value
+            elif key.startswith("L"):
+                tasks[key] = value
+    return tasks, version
+
+
 def load_system_prompt(path: Path) -> str:
-    """Carrega system prompt do arquivo."""
-    return path.read_text(encoding="utf-8")
+    """Carrega system prompt do arquivo. Cacheado por (caminho, mtime)."""
+    return _load_system_prompt(str(path), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _load_system_prompt(path: str, mtime_ns: int) -> str:
+    return Path(path).read_text(encoding="utf-8")
+
+
+def index_gabarito(gabarito: dict) -> dict:
+    """
+    Reorganiza o gabarito campo a campo ("struct of arrays"):
+    {"level": {task_id: nível}, "answer": {task_id: letra}} (answer só para L1),
+    mais as partições "l1_ids" / "l2_ids" (L2-L4) como frozensets.
+    Os loops por task fazem uma consulta plana em vez de gabarito[task_id][campo],
+    e cada arquivo separa suas tasks por interseção de conjuntos.
+    """
+    levels = {task_id: g["level"] for task_id, g in gabarito.items()}
+    l1_ids = frozenset(task_id for task_id, level in levels.items() if level == 1)
+    return {
+        "level": levels,
+        "answer": {task_id: gabarito[task_id]["answer"] for task_id in l1_ids},
+        "l1_ids": l1_ids,
+        "l2_ids": frozenset(levels.keys() - l1_ids),
+    }
 
 
 def load_response_file(path: Path) -> dict:
     """Carrega um arquivo de respostas."""
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
+    return jsonio.load_file(path)
 
 
 # ============================================================
@@ -39,25 +101,39 @@ def evaluate_l1(response_letter: str, correct_letter: str) -> int:
     return 1 if response_letter.strip().upper() == correct_letter.strip().upper() else 0
 
 
+def evaluate_l1_batch(pairs: list[tuple[str, str]]) -> list[int]:
+    """Versão em lote de evaluate_l1: (resposta, gabarito) → veredictos, numa só passada."""
+    return [int(r.strip().upper() == c.strip().upper()) for r, c in pairs]
+
+
 # ============================================================
 # L2-L4 — PROMPT BUILDER
 # ============================================================
 
-def build_user_prompt(task_id: str, gab_entry: dict, response_text: str) -> str:
-    """Monta prompt de avaliação para uma task."""
-    criteria_text = "\n".join(
-        f"{i + 1}. {c}" for i, c in enumerate(gab_entry["criteria"])
-    )
+@lru_cache(maxsize=4096)
+def _prompt_header(task_id: str, question: str, criteria: tuple[str, ...]) -> str:
+    """
+    Parte invariante do prompt de uma task (igual para todos os arquivos de resposta).
+    Fica no início da mensagem para formar um prefixo comum entre chamadas da mesma
+    task — o prompt caching da OpenAI reaproveita o maior prefixo idêntico.
+    """
+    criteria_text = "\n".join(f"{i + 1}. {c}" for i, c in enumerate(criteria))
     return f"""Avalie a resposta abaixo contra os critérios listados.
 
 TASK: {task_id}
 
-PERGUNTA: {gab_entry["question"]}
+PERGUNTA: {question}
 
 CRITÉRIOS (TODOS devem ser atendidos para SUCESSO):
 {criteria_text}
 
-RESPOSTA AVALIADA:
+"""
+
+
+def build_user_prompt(task_id: str, gab_entry: dict, response_text: str) -> str:
+    """Monta prompt de avaliação para uma task: cabeçalho fixo + resposta (sempre no final)."""
+    header = _prompt_header(task_id, gab_entry["question"], tuple(gab_entry["criteria"]))
+    return f"""{header}RESPOSTA AVALIADA:
 \"\"\"
 {response_text}
 \"\"\"
@@ -68,25 +144,106 @@ RESPOSTA AVALIADA:
 # AVALIAÇÃO DE UM ARQUIVO — MODO SÍNCRONO
 # ============================================================
 
+def _evaluate_task(
+    task_id: str,
+    user_prompt: str,
+    file_id: str,
+    system_prompt: str,
+    service_tier: str | None,
+    use_cache: bool = True,
+) -> tuple[str, int, str, dict, str]:
+    """
+    Avalia uma task L2-L4 via call_openai (que consulta o cache de veredictos).
+    Roda numa thread do pool de submit_file_tasks.
+    
+    Returns:
+        (task_id, verdict, justificativa, usage, status)
+        - usage: usage_info de call_openai (usage["cached"] indica acerto no cache)
+        - status: texto curto para a linha de progresso (✓ / ✗ (motivo) / ❌ ERRO)
+    """
+    result, usage = call_openai(
+        system_prompt, user_prompt, service_tier=service_tier, use_cache=use_cache
+    )
+
+    if result is None:
+        justificativa = (
+            f"\n### {file_id} — {task_id}\n"
+            f"- ERRO: falha na chamada API\n"
+            f"- **Veredicto: 0** (erro)\n"
+        )
+        return task_id, 0, justificativa, usage, "❌ ERRO"
+
+    verdict = result.get("verdict", 0)
+    if verdict == 1:
+        return task_id, verdict, f"✓ {task_id} — all criteria met", usage, "✓"
+
+    lines = [f"\n### {file_id} — {task_id}"]
+    for c in result.get("criteria", []):
+        sym = "✓" if c.get("met") else "✗"
+        evidence = c.get("evidence", "?")
+        lines.append(f"- C{c.get('id', '?')}: {sym} — {evidence}")
+
+    hall = result.get("hallucination")
+    if hall:
+        lines.append(f"- Alucinação: {hall}")
+
+    reason = result.get("fail_reason", "critério ausente")
+    lines.append(f"- **Veredicto: 0** ({reason})")
+    return task_id, verdict, "\n".join(lines), usage, f"✗ ({reason})"
+
+
 def evaluate_file(
     file_path: Path,
     gabarito: dict,
     system_prompt: str,
     service_tier: str | None = None,
-) -> tuple[str, dict, list, dict]:
+    index: dict | None = None,
+    use_cache: bool = True,
+) -> tuple[str, dict, list, dict, list]:
     """
     Avalia todas as tasks de um arquivo de forma síncrona.
-    Retorna (file_id, tasks_dict, justificativas_list, token_usage).
+    L1 é avaliado localmente; as chamadas L2-L4 rodam em paralelo
+    (até MAX_CONCURRENCY threads, respeitando OPENAI_RPM_LIMIT).
+    Tasks já julgadas com o mesmo prompt e modelo vêm do cache de veredictos.
+    Para vários arquivos num único pool, use submit_file_tasks + collect_file_results.
     
     Args:
         file_path: Caminho do arquivo de respostas
         gabarito: Dict com tasks do gabarito
         system_prompt: System prompt do juiz
         service_tier: "flex" para modo flex, None para standard
+        index: index_gabarito(gabarito), para reaproveitar entre arquivos
+        use_cache: False reavalia tudo na API (--no-cache)
     
     Returns:
-        Tupla (file_id, tasks, justificativas, token_usage)
+        Tupla (file_id, tasks, justificativas, token_usage, cached_tasks)
         - token_usage: {"prompt_tokens": int, "completion_tokens": int, "api_calls": int}
+        - cached_tasks: task_ids L2-L4 cujo veredicto veio do cache (sem chamada à API)
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        pending = submit_file_tasks(
+            file_path, gabarito, system_prompt, executor, service_tier, index, use_cache
+        )
+        return collect_file_results(pending)
+
+
+def submit_file_tasks(
+    file_path: Path,
+    gabarito: dict,
+    system_prompt: str,
+    executor: ThreadPoolExecutor,
+    service_tier: str | None = None,
+    index: dict | None = None,
+    use_cache: bool = True,
+) -> tuple[str, dict, list, int, list]:
+    """
+    Fase local de um arquivo: avalia o L1 e enfileira as tasks L2-L4 em executor.
+    O executor pode ser compartilhado entre arquivos (um único pool de tasks);
+    index (index_gabarito) também, para não reindexar o gabarito a cada arquivo.
+    
+    Returns:
+        Tupla (file_id, tasks, justificativas, total, jobs) para collect_file_results
+        - jobs: [(idx, task_id, future de _evaluate_task)] na ordem das tasks
     """
     data = load_response_file(file_path)
     file_id = data["metadata"]["id"]
@@ -94,82 +251,101 @@ def evaluate_file(
 
     tasks = {}
     justificativas = []
-    token_usage = {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "api_calls": 0,
-    }
-
-    sorted_tasks = sorted(responses.keys())
-    total = len(sorted_tasks)
-
-    for idx, task_id in enumerate(sorted_tasks, 1):
-        response_text = responses[task_id]
-
-        if task_id not in gabarito:
-            print(f"  ⚠ {task_id} ausente no gabarito, pulando")
-            continue
-
-        gab = gabarito[task_id]
-        level = gab["level"]
-
-        # --- L1: local ---
-        if level == 1:
-            verdict = evaluate_l1(response_text, gab["answer"])
-            tasks[task_id] = verdict
-            r = response_text.strip().upper()
-            c = gab["answer"].strip().upper()
 
-            symbol = "✓" if verdict else "✗"
-            if verdict:
-                justificativas.append(f"✓ {task_id} — '{r}' = '{c}'")
-            else:
-                justificativas.append(f"✗ {task_id} — '{r}' ≠ '{c}'")
-            print(f"  [{idx:>3}/{total}] {task_id}: {symbol} (L1)")
-            continue
-
-        # --- L2-L4: API ---
-        user_prompt = build_user_prompt(task_id, gab, response_text)
-        print(f"  [{idx:>3}/{total}] {task_id}: ", end="", flush=True)
-
-        result, usage = call_openai(system_prompt, user_prompt, service_tier=service_tier)
-        token_usage["api_calls"] += 1
-        token_usage["prompt_tokens"] += usage["prompt_tokens"]
-        token_usage["completion_tokens"] += usage["completion_tokens"]
-
-        if result is None:
-            print("❌ ERRO")
-            tasks[task_id] = 0
-            justificativas.append(
-                f"\n### {file_id} — {task_id}\n"
-                f"- ERRO: falha na chamada API\n"
-                f"- **Veredicto: 0** (erro)\n"
-            )
-            continue
-
-        verdict = result.get("verdict", 0)
+    index = index or index_gabarito(gabarito)
+    answers = index["answer"]
+
+    # Partição das tasks do arquivo por interseção com o gabarito
+    task_ids = responses.keys()
+    l1_here = sorted(task_ids & index["l1_ids"])
+    l2_here = sorted(task_ids & index["l2_ids"])
+    total = len(l1_here) + len(l2_here)
+    log_lines = [  # saída da fase local, emitida de uma vez ao final
+        f"  ⚠ {file_id} {task_id} ausente no gabarito, pulando\n"
+        for task_id in sorted(task_ids - index["level"].keys())
+    ]
+
+    # --- L1: local ---
+    for idx, task_id in enumerate(l1_here, 1):
+        r = responses[task_id].strip().upper()
+        c = answers[task_id].strip().upper()
+        verdict = int(r == c)  # = evaluate_l1, reaproveitando r/c da justificativa
         tasks[task_id] = verdict
 
-        if verdict == 1:
-            justificativas.append(f"✓ {task_id} — all criteria met")
-            print("✓")
+        symbol = "✓" if verdict else "✗"
+        if verdict:
+            justificativas.append(f"✓ {task_id} — '{r}' = '{c}'")
         else:
-            lines = [f"\n### {file_id} — {task_id}"]
-            for c in result.get("criteria", []):
-                sym = "✓" if c.get("met") else "✗"
-                evidence = c.get("evidence", "?")
-                lines.append(f"- C{c.get('id', '?')}: {sym} — {evidence}")
+            justificativas.append(f"✗ {task_id} — '{r}' ≠ '{c}'")
+        log_lines.append(f"  [{idx:>3}/{total}] {file_id} {task_id}: {symbol} (L1)\n")
+
+    sys.stdout.write("".join(log_lines))
+
+    # --- L2-L4: API (concorrente, limitado pelo rate limiter de llm.py) ---
+    jobs = [
+        (
+            idx,
+            task_id,
+            executor.submit(
+                _evaluate_task,
+                task_id,
+                build_user_prompt(task_id, gabarito[task_id], responses[task_id]),
+                file_id,
+                system_prompt,
+                service_tier,
+                use_cache,
+            ),
+        )
+        for idx, task_id in enumerate(l2_here, len(l1_here) + 1)
+    ]
+    return file_id, tasks, justificativas, total, jobs
+
+
+def collect_file_results(
+    pending: tuple[str, dict, list, int, list],
+) -> tuple[str, dict, list, dict, list]:
+    """
+    Aguarda as tasks L2-L4 enfileiradas por submit_file_tasks, na ordem das tasks
+    (justificativas saem ordenadas). Exceções de uma task são propagadas.
+    
+    Returns:
+        Tupla (file_id, tasks, justificativas, token_usage, cached_tasks), como evaluate_file
+    """
+    file_id, tasks, justificativas, total, jobs = pending
+    usages = []  # usage das chamadas que foram à API (acertos no cache não contam)
+    cached_tasks = []
+
+    # Progresso acumulado e escrito no máximo a cada PROGRESS_INTERVAL (erros saem na hora)
+    progress = []
+    last_write = time.monotonic()
+
+    for idx, task_id, future in jobs:
+        _, verdict, justificativa, usage, status = future.result()
+        prefix = f"  [{idx:>3}/{total}] {file_id} {task_id}:"
+        if usage.get("cached"):
+            prefix += " (cache)"
+            cached_tasks.append(task_id)
+        else:
+            usages.append(usage)
 
-            hall = result.get("hallucination")
-            if hall:
-                lines.append(f"- Alucinação: {hall}")
+        tasks[task_id] = verdict
+        justificativas.append(justificativa)
+        progress.append(f"{prefix} {status}\n")
 
-            reason = result.get("fail_reason", "critério ausente")
-            lines.append(f"- **Veredicto: 0** ({reason})")
-            justificativas.append("\n".join(lines))
-            print(f"✗ ({reason})")
+        now = time.monotonic()
+        if status.startswith("❌") or now - last_write >= PROGRESS_INTERVAL:
+            sys.stdout.write("".join(progress))
+            progress.clear()
+            last_write = now
 
-    return file_id, tasks, justificativas, token_usage
+    sys.stdout.write("".join(progress))
+
+    token_usage = {
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "completion_tokens": sum(u["completion_tokens"] for u in usages),
+        "api_calls": len(usages),
+    }
+    return file_id, tasks, justificativas, token_usage, cached_tasks
 
 
 # ============================================================
@@ -197,54 +373,62 @@ def prepare_batch(
         - total_lines: número de linhas no JSONL (tasks L2-L4)
         - total_l1: número de tasks L1 avaliadas localmente
     """
-    batch_lines = []
+    batch_count = 0
     l1_results = {}
     total_l1 = 0
     
-    for file_path in response_files:
-        data = load_response_file(file_path)
-        file_id = data["metadata"]["id"]
-        responses = data["responses"]
-        
-        l1_results[file_id] = {}
-        
-        for task_id in sorted(responses.keys()):
-            response_text = responses[task_id]
-            
-            if task_id not in gabarito:
-                continue
-            
-            gab = gabarito[task_id]
-            level = gab["level"]
-            
-            # L1: avaliar localmente
-            if level == 1:
-                verdict = evaluate_l1(response_text, gab["answer"])
-                l1_results[file_id][task_id] = verdict
-                total_l1 += 1
-            
-            # L2-L4: preparar para batch
-            else:
-                user_prompt = build_user_prompt(task_id, gab, response_text)
-                custom_id = f"{file_id}____{task_id}"
-                line = build_batch_line(custom_id, system_prompt, user_prompt)
-                batch_lines.append(line)
-    
-    # Salvar JSONL
+    # JSONL gravado arquivo a arquivo, na ordem de response_files
+    index = index_gabarito(gabarito)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(batch_lines))
+    with open(output_path, "w", encoding="utf-8", buffering=1024 * 1024) as fout:
+        for file_path in response_files:
+            file_id, file_l1, batch_lines = _prepare_one(file_path, gabarito, system_prompt, index)
+            l1_results[file_id] = file_l1
+            total_l1 += len(file_l1)
+            for line in batch_lines:
+                fout.write(line)
+                fout.write("\n")
+            batch_count += len(batch_lines)
     
     # Salvar resultados L1
     l1_path = output_path.with_suffix(".l1.json")
-    with open(l1_path, "w", encoding="utf-8") as f:
-        json.dump(l1_results, f, indent=2, ensure_ascii=False)
+    jsonio.dump_file(l1_results, l1_path)
     
-    print(f"✅ Batch preparado: {len(batch_lines)} tasks L2-L4, {total_l1} tasks L1 locais")
+    print(f"✅ Batch preparado: {batch_count} tasks L2-L4, {total_l1} tasks L1 locais")
     print(f"   JSONL: {output_path}")
     print(f"   L1: {l1_path}")
     
-    return len(batch_lines), total_l1
+    return batch_count, total_l1
+
+
+def _prepare_one(
+    file_path: Path,
+    gabarito: dict,
+    system_prompt: str,
+    index: dict,
+) -> tuple[str, dict, list[str]]:
+    """Avalia o L1 de um arquivo e monta as linhas JSONL das suas tasks L2-L4."""
+    data = load_response_file(file_path)
+    file_id = data["metadata"]["id"]
+    responses = data["responses"]
+    answers = index["answer"]
+    
+    # L1: avaliar localmente, numa única passada
+    l1 = {
+        task_id: int(responses[task_id].strip().upper() == answers[task_id].strip().upper())
+        for task_id in sorted(responses.keys() & index["l1_ids"])
+    }
+    
+    # L2-L4: preparar para batch
+    batch_lines = [
+        build_batch_line(
+            f"{file_id}{_SEP}{task_id}",
+            system_prompt,
+            build_user_prompt(task_id, gabarito[task_id], responses[task_id]),
+        )
+        for task_id in sorted(responses.keys() & index["l2_ids"])
+    ]
+    return file_id, l1, batch_lines
 
 
 # ============================================================
@@ -271,67 +455,63 @@ def process_batch_results(
         - token_usage: {"prompt_tokens": int, "completion_tokens": int, "api_calls": int}
     """
     # Carregar L1 locais
-    with open(l1_results_path, encoding="utf-8") as f:
-        l1_data = json.load(f)
+    l1_data = jsonio.load_file(l1_results_path)
     
-    # Organizar por file_id
+    # Organizar por file_id: veredictos + itens do batch (para as justificativas)
     by_file = {}
-    for file_id, l1_tasks in l1_data.items():
-        by_file[file_id] = {"tasks": dict(l1_tasks)}
     
-    # Acumular tokens
-    token_usage = {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "api_calls": 0,
-    }
+    def file_entry(file_id: str) -> dict:
+        return by_file.setdefault(file_id, {"tasks": {}, "batch_items": {}})
+    
+    for file_id, l1_tasks in l1_data.items():
+        file_entry(file_id)["tasks"].update(l1_tasks)
     
-    # Processar resultados do batch
+    # Processar resultados do batch numa única passada
+    usages = []
     for item in batch_results:
         custom_id = item["custom_id"]
         result = item["result"]
         usage = item["usage"]
         
-        # Parsear custom_id: file_id____task_id
-        parts = custom_id.split("____")
-        if len(parts) != 2:
+        # Parsear custom_id: file_id{_SEP}task_id
+        file_id, sep, task_id = custom_id.partition(_SEP)
+        if not sep:
             print(f"⚠️  custom_id inválido: {custom_id}")
             continue
         
-        file_id, task_id = parts
-        
-        # Inicializar file_id se necessário
-        if file_id not in by_file:
-            by_file[file_id] = {"tasks": {}}
+        entry = file_entry(file_id)
+        entry["batch_items"][task_id] = item
         
         # Guardar resultado
         if result is None:
-            by_file[file_id]["tasks"][task_id] = 0
+            entry["tasks"][task_id] = 0
         else:
-            verdict = result.get("verdict", 0)
-            by_file[file_id]["tasks"][task_id] = verdict
+            entry["tasks"][task_id] = result.get("verdict", 0)
         
-        # Acumular tokens
-        token_usage["prompt_tokens"] += usage["prompt_tokens"]
-        token_usage["completion_tokens"] += usage["completion_tokens"]
-        token_usage["api_calls"] += 1
+        usages.append(usage)
+    
+    token_usage = {
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "completion_tokens": sum(u["completion_tokens"] for u in usages),
+        "api_calls": len(usages),
+    }
     
     # Gerar justificativas e sumários
     all_justificativas = []
     all_results = {}
+    get_gab = gabarito.get  # uma consulta por task (em vez de `in` + indexação)
     
     for file_id, file_data in sorted(by_file.items()):
         tasks = file_data["tasks"]
+        batch_items = file_data["batch_items"]
         file_justificativas = []
         
         # Gerar justificativas para cada task
-        for task_id in sorted(tasks.keys()):
-            verdict = tasks[task_id]
-            
-            if task_id not in gabarito:
+        for task_id, verdict in sorted(tasks.items()):
+            gab = get_gab(task_id)
+            if gab is None:
                 continue
             
-            gab = gabarito[task_id]
             level = gab["level"]
             
             # L1: simples comparação
@@ -343,12 +523,7 @@ def process_batch_results(
             
             # L2-L4: buscar resultado completo do batch
             else:
-                # Encontrar resultado no batch
-                batch_item = None
-                for item in batch_results:
-                    if item["custom_id"] == f"{file_id}____{task_id}":
-                        batch_item = item
-                        break
+                batch_item = batch_items.get(task_id)
                 
                 if batch_item is None or batch_item["result"] is None:
                     file_justificativas.append(
@@ -399,32 +574,56 @@ def process_batch_results(
 
 def compute_summary(tasks: dict) -> dict:
     """Agrupa resultados por nível e calcula taxas."""
-    levels = {}
+    evaluated = Counter()
+    success = Counter()
     for task_id, verdict in tasks.items():
-        level = task_id.split("_")[0]
-        if level not in levels:
-            levels[level] = {"evaluated": 0, "success": 0}
-        levels[level]["evaluated"] += 1
-        levels[level]["success"] += verdict
+        level = task_id.split("_", 1)[0]
+        evaluated[level] += 1
+        success[level] += verdict
+
+    return _summarize_levels(evaluated, success)
 
-    summary = {}
-    total_eval = 0
-    total_success = 0
 
-    for level in sorted(levels.keys()):
-        e = levels[level]["evaluated"]
-        s = levels[level]["success"]
+def compute_summaries(tasks_by_file: dict) -> dict:
+    """
+    Versão multi-arquivo de compute_summary: conta (arquivo, nível) numa
+    única passada sobre todos os veredictos.
+    Retorna {file_id: summary}, no mesmo formato de compute_summary.
+    """
+    evaluated = Counter()
+    success = Counter()
+    for file_id, tasks in tasks_by_file.items():
+        for task_id, verdict in tasks.items():
+            key = (file_id, task_id.split("_", 1)[0])
+            evaluated[key] += 1
+            success[key] += verdict
+
+    by_file = {file_id: (Counter(), Counter()) for file_id in tasks_by_file}
+    for (file_id, level), e in evaluated.items():
+        file_evaluated, file_success = by_file[file_id]
+        file_evaluated[level] = e
+        file_success[level] = success[(file_id, level)]
+
+    return {file_id: _summarize_levels(*counts) for file_id, counts in by_file.items()}
+
+
+def _summarize_levels(evaluated: Counter, success: Counter) -> dict:
+    """Converte contagens por nível (avaliadas, sucessos) no sumário com taxas + overall."""
+    summary = {}
+    for level in sorted(evaluated):
+        e = evaluated[level]
+        s = success[level]
         summary[level] = {
             "evaluated": e,
             "success": s,
             "rate": round(s / e, 2) if e > 0 else 0,
         }
-        total_eval += e
-        total_success += s
 
+    total_eval = sum(evaluated.values())
+    total_success = sum(success.values())
     summary["overall"] = {
         "evaluated": total_eval,
         "success": total_success,
         "rate": round(total_success / total_eval, 2) if total_eval > 0 else 0,
     }
-    return summary
\ No newline at end of file
+    return summary
@@ -0,0 +1,41 @@
+"""Leitura/escrita JSON: usa orjson quando instalado, com fallback para a stdlib."""
+
+import json
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes | str):
+    """Desserializa JSON a partir de bytes ou str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """
+    Serializa para bytes UTF-8 (sem escapar não-ASCII); indent=True → 2 espaços.
+    Sem indent a saída é compacta nos dois caminhos (o fallback usa os mesmos
+    separadores sem espaço do orjson), o que reduz o JSONL enviado ao batch.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def load_file(path: Path):
+    """Carrega um arquivo JSON inteiro."""
+    return loads(path.read_bytes())
+
+
+def dump_file(obj, path: Path, indent: bool = True) -> None:
+    """Grava obj como JSON UTF-8 em path."""
+    with open(path, "wb") as f:
+        f.write(dumps(obj, indent=indent))
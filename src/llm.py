@@ -1,16 +1,110 @@
 """Interface para chamadas à API da OpenAI (síncronas e batch)."""
 
 import json
+import random
+import threading
 import time
 from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
 
-from openai import OpenAI
-from openai.types import Batch
+from . import jsonio
+from .cache import cache_key, get_verdict_cache
+from .config import JUDGE_TEMPERATURE, OPENAI_MODEL, OPENAI_RPM_LIMIT, MAX_CONCURRENCY, BATCH_COMPLETION_WINDOW, BATCH_ENDPOINT
 
-from .config import OPENAI_MODEL, BATCH_COMPLETION_WINDOW, BATCH_ENDPOINT
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from openai.types import Batch
 
-# Cliente OpenAI (usa OPENAI_API_KEY do ambiente automaticamente)
-client = OpenAI()
+
+_client: "OpenAI | None" = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "OpenAI":
+    """
+    Cliente OpenAI compartilhado, criado na primeira chamada à API.
+    
+    O import do SDK fica em _create_client para que `--help` e caminhos sem chamadas
+    (ex.: tudo vindo do cache) não paguem o custo de carregar openai/httpx.
+    Usa OPENAI_API_KEY do ambiente automaticamente.
+    
+    O pool HTTP mantém uma conexão keep-alive por worker (MAX_CONCURRENCY) e
+    segura conexões ociosas por mais tempo que o padrão do httpx (5s), já que
+    o rate limiter pode espaçar as chamadas: o handshake TLS é pago uma vez.
+    Com o pacote opcional h2 instalado, usa HTTP/2 (chamadas concorrentes
+    multiplexadas na mesma conexão).
+    
+    Criação protegida por lock: os workers flex/standard chamam em paralelo na
+    primeira vez e cada cliente extra teria o seu próprio pool de conexões.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def _create_client() -> "OpenAI":
+    import importlib.util
+    
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+    
+    limits = httpx.Limits(
+        max_connections=MAX_CONCURRENCY * 2,  # folga para upload/poll do batch
+        max_keepalive_connections=MAX_CONCURRENCY,
+        keepalive_expiry=60,
+    )
+    http2 = importlib.util.find_spec("h2") is not None
+    return OpenAI(http_client=DefaultHttpxClient(limits=limits, http2=http2))
+
+
+class TokenBucket:
+    """
+    Rate limiter thread-safe: libera até `rate` permissões a cada `period` segundos.
+    
+    O balde começa cheio e é reabastecido continuamente (rate/period por segundo),
+    então chamadas concorrentes respeitam o RPM da conta sem sleep fixo entre elas.
+    """
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Bloqueia até haver uma permissão disponível."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+# Limiter compartilhado por todas as chamadas síncronas (todas as threads)
+rate_limiter = TokenBucket(OPENAI_RPM_LIMIT)
+
+# Teto global de requisições em voo (arquivos avaliados em paralelo compartilham)
+inflight = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+
+def _retry_after(error: Exception) -> float:
+    """Segundos sugeridos pelo header Retry-After de um 429 (0 se ausente/inválido)."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
 
 
 def call_openai(
@@ -18,50 +112,74 @@ def call_openai(
     user_prompt: str,
     model: str | None = None,
     service_tier: str | None = None,
+    use_cache: bool = True,
 ) -> tuple[dict | None, dict]:
     """
-    Faz chamada síncrona à API OpenAI com retry.
+    Faz chamada síncrona à API OpenAI com retry, consultando antes o cache de veredictos.
     
     Args:
         system_prompt: Instruções do sistema (juiz)
         user_prompt: Prompt do usuário (task a avaliar)
         model: Modelo a usar (default: config.OPENAI_MODEL)
         service_tier: "flex" para modo flex, None para standard
+        use_cache: False ignora o cache na leitura (o resultado novo é gravado mesmo assim)
     
     Returns:
         Tupla (resultado_parseado, usage_info)
         - resultado_parseado: dict do JSON ou None se erro
-        - usage_info: {"prompt_tokens": int, "completion_tokens": int, "effective_mode": str}
+        - usage_info: {"prompt_tokens": int, "completion_tokens": int, "cached_tokens": int,
+          "effective_mode": str, "cached": bool} — acertos no cache de veredictos têm
+          tokens 0 e cached=True; cached_tokens é a parte do prompt servida pelo
+          prompt caching da OpenAI (prefixo repetido, cobrada com desconto)
     """
     model = model or OPENAI_MODEL
     timeout = 900 if service_tier == "flex" else 120  # 15min flex, 2min standard
+    
+    verdicts = get_verdict_cache()
+    key = cache_key(system_prompt, user_prompt, model)
+    if use_cache:
+        cached = verdicts.get(key)
+        if cached is not None:
+            return cached, {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+                "effective_mode": "flex" if service_tier == "flex" else "standard",
+                "cached": True,
+            }
 
     def is_invalid_service_tier(error: Exception) -> bool:
         message = str(error)
         return "Invalid service_tier" in message and "400" in message
 
     def run_request(tier: str | None, request_timeout: int) -> tuple[dict, dict]:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0,
-            response_format={"type": "json_object"},
-            timeout=request_timeout,
-            **({"service_tier": tier} if tier else {}),
-        )
+        with inflight:
+            rate_limiter.acquire()
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=JUDGE_TEMPERATURE,
+                response_format={"type": "json_object"},
+                timeout=request_timeout,
+                **({"service_tier": tier} if tier else {}),
+            )
 
         content = response.choices[0].message.content
-        result = json.loads(content)
+        result = jsonio.loads(content)
 
+        details = getattr(response.usage, "prompt_tokens_details", None)  # SDKs antigos não têm
         usage_info = {
             "prompt_tokens": response.usage.prompt_tokens,
             "completion_tokens": response.usage.completion_tokens,
+            "cached_tokens": (details.cached_tokens or 0) if details else 0,
             "effective_mode": "flex" if tier == "flex" else "standard",
+            "cached": False,
         }
 
+        verdicts.put(key, result, usage_info)
         return result, usage_info
     
     # Retry com backoff exponencial
@@ -83,6 +201,8 @@ def call_openai(
             # Retry para erros recuperáveis
             if attempt < 2 and error_type in ["RateLimitError", "APITimeoutError", "InternalServerError", "ServiceUnavailableError"]:
                 wait = 2 ** attempt  # 2s, 4s
+                if error_type == "RateLimitError":
+                    wait = max(wait, _retry_after(e))  # 429: respeitar o Retry-After do servidor
                 print(f"⚠️  {error_type}, retry {attempt+1}/3 em {wait}s...")
                 time.sleep(wait)
                 continue
@@ -92,24 +212,28 @@ def call_openai(
             return None, {
                 "prompt_tokens": 0,
                 "completion_tokens": 0,
+                "cached_tokens": 0,
                 "effective_mode": "standard" if service_tier != "flex" else "flex",
+                "cached": False,
             }
     
     return None, {
         "prompt_tokens": 0,
         "completion_tokens": 0,
+        "cached_tokens": 0,
         "effective_mode": "standard" if service_tier != "flex" else "flex",
+        "cached": False,
     }
 
 
-def build_batch_line(
+def build_batch_request(
     custom_id: str,
     system_prompt: str,
     user_prompt: str,
     model: str | None = None,
-) -> str:
+) -> dict:
     """
-    Gera linha JSONL para Batch API.
+    Monta a requisição da Batch API (ainda não serializada).
     
     Args:
         custom_id: ID único para rastrear a task
@@ -118,17 +242,15 @@ def build_batch_line(
         model: Modelo a usar (default: config.OPENAI_MODEL)
     
     Returns:
-        String JSON (uma linha do arquivo JSONL)
+        Dict com custom_id, method, url e body
     """
-    model = model or OPENAI_MODEL
-    
-    batch_request = {
+    return {
         "custom_id": custom_id,
         "method": "POST",
         "url": BATCH_ENDPOINT,
         "body": {
-            "model": model,
-            "temperature": 0,
+            "model": model or OPENAI_MODEL,
+            "temperature": JUDGE_TEMPERATURE,
             "response_format": {"type": "json_object"},
             "messages": [
                 {"role": "system", "content": system_prompt},
@@ -136,22 +258,41 @@ def build_batch_line(
             ],
         },
     }
+
+
+def build_batch_line(
+    custom_id: str,
+    system_prompt: str,
+    user_prompt: str,
+    model: str | None = None,
+) -> str:
+    """
+    Gera linha JSONL para Batch API (build_batch_request serializado).
     
-    return json.dumps(batch_request, ensure_ascii=False)
+    Returns:
+        String JSON (uma linha do arquivo JSONL)
+    """
+    batch_request = build_batch_request(custom_id, system_prompt, user_prompt, model)
+    return jsonio.dumps(batch_request).decode("utf-8")
 
 
-def upload_batch_file(file_path: str) -> str:
+def upload_batch_file(file: str | Path | bytes) -> str:
     """
     Upload arquivo JSONL para OpenAI.
     
     Args:
-        file_path: Caminho do arquivo .jsonl
+        file: Caminho do arquivo .jsonl, ou o conteúdo JSONL já em memória (bytes)
     
     Returns:
         file_id da OpenAI
     """
-    with open(file_path, "rb") as f:
-        file_obj = client.files.create(file=f, purpose="batch")
+    if isinstance(file, bytes):
+        file_obj = get_client().files.create(file=("batch.jsonl", file), purpose="batch")
+    else:
+        # O handle é repassado ao httpx, que lê o corpo multipart do disco em partes;
+        # o buffer de 1 MB agrupa essas leituras em menos syscalls
+        with open(file, "rb", buffering=1 << 20) as f:
+            file_obj = get_client().files.create(file=f, purpose="batch")
     
     print(f"✅ Arquivo enviado: {file_obj.id}")
     return file_obj.id
@@ -167,7 +308,7 @@ def create_batch(input_file_id: str) -> str:
     Returns:
         batch_id
     """
-    batch = client.batches.create(
+    batch = get_client().batches.create(
         input_file_id=input_file_id,
         endpoint=BATCH_ENDPOINT,
         completion_window=BATCH_COMPLETION_WINDOW,
@@ -177,13 +318,19 @@ def create_batch(input_file_id: str) -> str:
     return batch.id
 
 
-def poll_batch(batch_id: str, interval: int = 30) -> Batch:
+def poll_batch(batch_id: str, interval: int = 10, max_interval: int = 300) -> "Batch":
     """
-    Poll batch até completar.
+    Poll batch até completar, com backoff exponencial.
+    
+    O intervalo dobra a cada poll sem progresso (até max_interval) e volta
+    ao mínimo assim que request_counts.completed avança. Cada espera leva
+    ±10% de jitter (batches simultâneos não pollam em sincronia) e um 429 no
+    retrieve não derruba o poll: o intervalo dobra, respeitando o Retry-After.
     
     Args:
         batch_id: ID do batch
-        interval: Intervalo entre polls em segundos
+        interval: Intervalo mínimo (e inicial) entre polls em segundos
+        max_interval: Teto do intervalo entre polls em segundos
     
     Returns:
         Batch object final
@@ -192,9 +339,19 @@ def poll_batch(batch_id: str, interval: int = 30) -> Batch:
         RuntimeError: Se batch falhar, expirar ou for cancelado
     """
     start_time = time.time()
+    wait = interval
+    last_completed = None
     
     while True:
-        batch = client.batches.retrieve(batch_id)
+        try:
+            batch = get_client().batches.retrieve(batch_id)
+        except Exception as e:
+            if type(e).__name__ != "RateLimitError":
+                raise
+            wait = max(min(wait * 2, max_interval), _retry_after(e))
+            print(f"⚠️  RateLimitError no poll, próximo em {wait:.0f}s...")
+            time.sleep(wait * random.uniform(0.9, 1.1))
+            continue
         status = batch.status
         
         # Calcular tempo decorrido
@@ -214,12 +371,62 @@ def poll_batch(batch_id: str, interval: int = 30) -> Batch:
             raise RuntimeError(f"❌ Batch terminou com status: {status}")
         
         # Aguardar próximo poll
-        time.sleep(interval)
+        if last_completed is not None:
+            wait = interval if completed > last_completed else min(wait * 2, max_interval)
+        last_completed = completed
+        time.sleep(wait * random.uniform(0.9, 1.1))
+
+
+def stream_batch_results(output_file_id: str) -> Iterator[dict]:
+    """
+    Baixa o output do batch em streaming e parseia linha a linha.
+    
+    Só uma linha fica em memória por vez (o corpo não é materializado como texto).
+    
+    Args:
+        output_file_id: ID do arquivo de output
+    
+    Yields:
+        Dicts com custom_id, result (JSON parseado ou None se inválido) e usage
+    """
+    with get_client().files.with_streaming_response.content(output_file_id) as content:
+        for line in content.iter_lines():
+            if not line:
+                continue
+            response_obj = {}
+            try:
+                response_obj = jsonio.loads(line)
+                custom_id = response_obj["custom_id"]
+                
+                # Extrair conteúdo e parsear JSON
+                message_content = response_obj["response"]["body"]["choices"][0]["message"]["content"]
+                result = jsonio.loads(message_content)
+                
+                # Extrair usage
+                usage = response_obj["response"]["body"]["usage"]
+                
+                yield {
+                    "custom_id": custom_id,
+                    "result": result,
+                    "usage": {
+                        "prompt_tokens": usage["prompt_tokens"],
+                        "completion_tokens": usage["completion_tokens"],
+                        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                    },
+                }
+                
+            except (json.JSONDecodeError, KeyError) as e:  # orjson.JSONDecodeError é subclasse
+                print(f"⚠️  Erro ao parsear linha do batch: {e}")
+                yield {
+                    "custom_id": response_obj.get("custom_id", "unknown"),
+                    "result": None,
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0},
+                }
 
 
 def download_batch_results(output_file_id: str) -> list[dict]:
     """
-    Download e parseia resultados do batch.
+    Download e parseia resultados do batch (lista completa de stream_batch_results).
     
     Args:
         output_file_id: ID do arquivo de output
@@ -227,40 +434,6 @@ def download_batch_results(output_file_id: str) -> list[dict]:
     Returns:
         Lista de dicts com custom_id, result (JSON parseado) e usage
     """
-    # Download do arquivo
-    content = client.files.content(output_file_id)
-    lines = content.text.strip().split("\n")
-    
-    results = []
-    
-    for line in lines:
-        try:
-            response_obj = json.loads(line)
-            custom_id = response_obj["custom_id"]
-            
-            # Extrair conteúdo e parsear JSON
-            message_content = response_obj["response"]["body"]["choices"][0]["message"]["content"]
-            result = json.loads(message_content)
-            
-            # Extrair usage
-            usage = response_obj["response"]["body"]["usage"]
-            
-            results.append({
-                "custom_id": custom_id,
-                "result": result,
-                "usage": {
-                    "prompt_tokens": usage["prompt_tokens"],
-                    "completion_tokens": usage["completion_tokens"],
-                },
-            })
-            
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"⚠️  Erro ao parsear linha do batch: {e}")
-            results.append({
-                "custom_id": response_obj.get("custom_id", "unknown"),
-                "result": None,
-                "usage": {"prompt_tokens": 0, "completion_tokens": 0},
-            })
-    
+    results = list(stream_batch_results(output_file_id))
     print(f"✅ {len(results)} resultados parseados")
     return results
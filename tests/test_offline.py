@@ -0,0 +1,218 @@
+"""Testes offline (sem API): rate limiter, backoff do poll, cache de veredictos e dedup do batch."""
+
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Cache de veredictos isolado (precisa vir antes do import de src.config, que lê a variável)
+os.environ["JUDGE_CACHE_PATH"] = str(
+    Path(tempfile.mkdtemp(prefix="offline_cache_")) / "judge_cache.sqlite"
+)
+
+from src import jsonio, llm
+from src.avaliar import prepare_batch, process_batch_results
+from src.cache import VerdictCache, cache_key
+from src.config import GABARITO_PATH, PROMPT_PATH
+from src.evaluate import index_gabarito, load_gabarito, load_system_prompt
+from src.llm import TokenBucket, _retry_after, poll_batch
+
+
+# ============================================================
+# RATE LIMITER
+# ============================================================
+
+def test_token_bucket_blocks_when_empty() -> None:
+    bucket = TokenBucket(2, period=0.2)  # 10 permissões/s
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.05, "balde cheio não deveria bloquear"
+
+    bucket.acquire()  # vazio: espera ~0.1s pela próxima permissão
+    assert time.monotonic() - start >= 0.08
+
+
+def test_token_bucket_refills_up_to_capacity() -> None:
+    bucket = TokenBucket(2, period=0.2)
+    bucket.acquire()
+    bucket.acquire()
+    time.sleep(0.5)  # reabastece mais que a capacidade
+
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    assert bucket.tokens < 1, "reabastecimento não pode passar da capacidade"
+
+
+# ============================================================
+# RETRY-AFTER
+# ============================================================
+
+def _rate_limit_error(headers: dict | None) -> Exception:
+    error = type("RateLimitError", (Exception,), {})()
+    error.response = None if headers is None else SimpleNamespace(headers=headers)
+    return error
+
+
+def test_retry_after_parsing() -> None:
+    assert _retry_after(_rate_limit_error({"retry-after": "7"})) == 7.0
+    assert _retry_after(_rate_limit_error({"retry-after": "1.5"})) == 1.5
+    assert _retry_after(_rate_limit_error({})) == 0.0  # header ausente
+    assert _retry_after(_rate_limit_error({"retry-after": "amanhã"})) == 0.0  # inválido
+    assert _retry_after(_rate_limit_error(None)) == 0.0  # erro sem response
+    assert _retry_after(ValueError("sem response")) == 0.0
+
+
+# ============================================================
+# BACKOFF DO POLL
+# ============================================================
+
+def _batch(status: str, completed: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id="batch-1",
+        status=status,
+        request_counts=SimpleNamespace(completed=completed, total=10),
+    )
+
+
+def _poll_waits(responses: list) -> list[float]:
+    """Roda poll_batch sobre a sequência de retrieves dada e devolve as esperas (sem jitter)."""
+    retrieve = mock.Mock(side_effect=responses)
+    client = SimpleNamespace(batches=SimpleNamespace(retrieve=retrieve))
+    with (
+        mock.patch.object(llm, "get_client", return_value=client),
+        mock.patch.object(llm.random, "uniform", return_value=1.0),
+        mock.patch.object(llm.time, "sleep") as sleep,
+    ):
+        poll_batch("batch-1", interval=10, max_interval=40)
+    return [call.args[0] for call in sleep.call_args_list]
+
+
+def test_poll_backoff_caps_and_resets_on_progress() -> None:
+    waits = _poll_waits([
+        _batch("in_progress", 0),
+        _batch("in_progress", 0),
+        _batch("in_progress", 0),
+        _batch("in_progress", 0),
+        _batch("in_progress", 0),
+        _batch("in_progress", 5),  # progresso: volta ao intervalo mínimo
+        _batch("in_progress", 5),
+        _batch("completed", 10),
+    ])
+    assert waits == [10, 20, 40, 40, 40, 10, 20]
+
+
+def test_poll_backoff_honours_retry_after() -> None:
+    waits = _poll_waits([
+        _batch("in_progress", 0),
+        _rate_limit_error({"retry-after": "90"}),  # acima do teto: vale o Retry-After
+        _rate_limit_error({}),
+        _batch("completed", 10),
+    ])
+    assert waits == [10, 90, 40]
+
+
+# ============================================================
+# CACHE DE VEREDICTOS
+# ============================================================
+
+def test_verdict_cache_round_trip() -> None:
+    cache = VerdictCache(Path(tempfile.mkdtemp(prefix="offline_cache_")) / "cache.sqlite")
+    key = cache_key("sistema", "prompt", "gpt-4o-mini")
+    result = {"verdict": 1, "criteria": [{"id": 1, "met": True, "evidence": "ação"}]}
+
+    assert cache.get(key) is None
+    cache.put(key, result, {"prompt_tokens": 100, "completion_tokens": 20})
+    assert cache.get(key) == result
+
+    cache.put(key, {"verdict": 0}, {"prompt_tokens": 100, "completion_tokens": 20})
+    assert cache.get(key) == {"verdict": 0}, "put deve substituir o resultado anterior"
+
+
+def test_cache_key_sensitivity() -> None:
+    base = cache_key("sistema", "prompt", "gpt-4o-mini", 0)
+    assert base == cache_key("sistema", "prompt", "gpt-4o-mini", 0)
+    assert base != cache_key("sistema", "prompt", "gpt-4o", 0)
+    assert base != cache_key("sistema", "prompt", "gpt-4o-mini", 0.7)
+    assert base != cache_key("sistema", "prompt 2", "gpt-4o-mini", 0)
+    assert base != cache_key("sistema 2", "prompt", "gpt-4o-mini", 0)
+    # Fronteira entre campos faz parte da chave
+    assert cache_key("ab", "c", "m", 0) != cache_key("a", "bc", "m", 0)
+
+
+# ============================================================
+# DEDUP DO BATCH
+# ============================================================
+
+def test_batch_duplicates_fan_out() -> None:
+    gabarito, _ = load_gabarito(GABARITO_PATH)
+    system_prompt = load_system_prompt(PROMPT_PATH)
+    task_id = sorted(index_gabarito(gabarito)["l2_ids"])[0]
+
+    # Três arquivos com a mesma resposta para a mesma task: um único prompt
+    tmp_dir = Path(tempfile.mkdtemp(prefix="offline_dedup_"))
+    response_files = []
+    for run in ("a", "b", "c"):
+        path = tmp_dir / f"{run}.json"
+        jsonio.dump_file(
+            {"metadata": {"id": run}, "responses": {task_id: "mesma resposta"}}, path
+        )
+        response_files.append(path)
+
+    jsonl_bytes, l1_results, responses_by_file, cached_results, cache_keys, dup_map = prepare_batch(
+        response_files, gabarito, system_prompt, use_cache=False
+    )
+    assert list(cache_keys) == [f"a::{task_id}"]
+    assert len(jsonl_bytes.splitlines()) == 1
+    assert dup_map == {f"b::{task_id}": f"a::{task_id}", f"c::{task_id}": f"a::{task_id}"}
+
+    batch_results = [{
+        "custom_id": f"a::{task_id}",
+        "result": {"verdict": 1, "criteria": []},
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "cached_tokens": 0},
+    }]
+    all_results, cost_info = process_batch_results(
+        batch_results, l1_results, gabarito, responses_by_file, cached_results, dup_map,
+        io.StringIO(),
+    )
+    assert {file_id: r["tasks"] for file_id, r in all_results.items()} == {
+        run: {task_id: 1} for run in ("a", "b", "c")
+    }
+    assert cost_info["api_calls"] == 1
+
+
+def test_batch_skips_invalid_custom_id() -> None:
+    # Linha ilegível no output do batch vira custom_id "unknown" (download_batch_results)
+    batch_results = [{
+        "custom_id": "unknown",
+        "result": None,
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0},
+    }]
+    all_results, cost_info = process_batch_results(
+        batch_results, {"a": {}}, {}, {"a": {}}, {}, {"unknown": "unknown"}, io.StringIO()
+    )
+    assert all_results["a"]["tasks"] == {}
+    assert cost_info["api_calls"] == 1
+
+
+def main() -> None:
+    tests = [obj for name, obj in globals().items() if name.startswith("test_")]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as exc:
+            failures += 1
+            print(f"❌ {test.__name__}: {exc!r}")
+    print(f"\n{len(tests) - failures}/{len(tests)} OK")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,16 @@
-import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+# O smoke test nunca grava no cache de veredictos usado pelas execuções reais
+# (precisa vir antes do import de src.config, que lê a variável)
+os.environ["JUDGE_CACHE_PATH"] = str(
+    Path(tempfile.mkdtemp(prefix="smoke_cache_")) / "judge_cache.sqlite"
+)
+
+from src import jsonio
 from src.config import (
     BATCH_POLL_INTERVAL,
     GABARITO_PATH,
@@ -9,22 +19,34 @@ from src.config import (
     RESPOSTAS_DIR,
     calculate_cost,
 )
-from src.evaluate import build_user_prompt, load_gabarito, load_response_file, load_system_prompt
+from src.evaluate import (
+    build_user_prompt,
+    index_gabarito,
+    load_gabarito,
+    load_response_file,
+    load_system_prompt,
+)
 from src.llm import (
     build_batch_line,
+    build_batch_request,
     call_openai,
     create_batch,
-    download_batch_results,
     poll_batch,
+    stream_batch_results,
     upload_batch_file,
 )
 
 
 TASK_ID = "L3_02"
 RESPONSE_FILE = "gemini25pro_run_01.json"
+SMOKE_VERBOSE = bool(os.getenv("SMOKE_VERBOSE"))  # imprime o payload batch formatado
+SMOKE_POLL_MAX_INTERVAL = 60  # batch pequeno: teto de backoff menor que o do avaliador
+SMOKE_BATCH_SIZE = int(os.getenv("SMOKE_BATCH_SIZE", "1"))  # tasks no arquivo batch (0 = todas L2-L4)
 
 
-def load_inputs() -> tuple[str, dict, str]:
+@lru_cache(maxsize=1)
+def load_inputs() -> tuple[str, str, str]:
+    """(system_prompt, user_prompt, response_text), lidos uma vez por processo."""
     system_prompt = load_system_prompt(PROMPT_PATH)
     gabarito, _ = load_gabarito(GABARITO_PATH)
     response_data = load_response_file(RESPOSTAS_DIR / RESPONSE_FILE)
@@ -39,54 +61,57 @@ def load_inputs() -> tuple[str, dict, str]:
     return system_prompt, user_prompt, response_text
 
 
+def load_batch_prompts(size: int) -> list[tuple[str, str]]:
+    """
+    (custom_id, user_prompt) para o fluxo batch: TASK_ID primeiro, completado com
+    as demais tasks L2-L4 respondidas em RESPONSE_FILE até `size` (0 = todas).
+    """
+    _system_prompt, user_prompt, _response_text = load_inputs()
+    prompts = [(f"smoke::{TASK_ID}", user_prompt)]
+    if size == 1:
+        return prompts
+
+    gabarito, _ = load_gabarito(GABARITO_PATH)
+    responses = load_response_file(RESPOSTAS_DIR / RESPONSE_FILE).get("responses", {})
+    task_ids = sorted((index_gabarito(gabarito)["l2_ids"] & responses.keys()) - {TASK_ID})
+    if size > 0:
+        task_ids = task_ids[: size - 1]
+    prompts.extend(
+        (f"smoke::{task_id}", build_user_prompt(task_id, gabarito[task_id], responses[task_id]))
+        for task_id in task_ids
+    )
+    return prompts
+
+
 def test_sync_call() -> None:
     print("\nTeste 1: Chamada sincronica isolada")
     try:
         system_prompt, user_prompt, _response_text = load_inputs()
-        result, usage = call_openai(system_prompt, user_prompt, service_tier="flex")
+        tier = "flex"
+        result, usage = call_openai(system_prompt, user_prompt, service_tier=tier, use_cache=False)
+        if result is None:
+            print("❌ Flex retornou resposta nula, repetindo em standard")
+            tier = "standard"
+            result, usage = call_openai(system_prompt, user_prompt, service_tier=None, use_cache=False)
 
-        print("response JSON (flex):")
+        print(f"response JSON ({tier}):")
         if result is None:
             print("null")
         else:
-            print(json.dumps(result, indent=2, ensure_ascii=False))
+            print(jsonio.dumps(result, indent=True).decode("utf-8"))
 
         verdict = None if result is None else result.get("verdict")
         cost = calculate_cost(
             OPENAI_MODEL,
-            "flex",
+            usage.get("effective_mode", tier),
             usage.get("prompt_tokens", 0),
             usage.get("completion_tokens", 0),
         )
 
-        print(f"verdict (flex): {verdict}")
-        print(f"usage (flex): {usage}")
-        print(f"custo estimado (flex): ${cost['usd']:.6f}")
-
-        flex_ok = result is not None
-        if not flex_ok:
-            print("❌ Flex retornou resposta nula")
-
-        if not flex_ok:
-            result_std, usage_std = call_openai(system_prompt, user_prompt, service_tier=None)
-            print("response JSON (standard):")
-            if result_std is None:
-                print("null")
-            else:
-                print(json.dumps(result_std, indent=2, ensure_ascii=False))
-
-            verdict_std = None if result_std is None else result_std.get("verdict")
-            cost_std = calculate_cost(
-                OPENAI_MODEL,
-                "standard",
-                usage_std.get("prompt_tokens", 0),
-                usage_std.get("completion_tokens", 0),
-            )
-
-            print(f"verdict (standard): {verdict_std}")
-            print(f"usage (standard): {usage_std}")
-            print(f"custo estimado (standard): ${cost_std['usd']:.6f}")
-            assert result_std is not None, "Resposta do juiz é None"
+        print(f"verdict ({tier}): {verdict}")
+        print(f"usage ({tier}): {usage}")
+        print(f"prompt caching ({tier}): {usage.get('cached_tokens', 0)}/{usage.get('prompt_tokens', 0)} tokens")
+        print(f"custo estimado ({tier}): ${cost['usd']:.6f}")
 
         assert result is not None, "Resposta do juiz é None"
         print("✅ Teste sincronico OK")
@@ -98,11 +123,11 @@ def test_batch_line() -> None:
     print("\nTeste 2: Geracao de linha batch")
     try:
         system_prompt, user_prompt, _response_text = load_inputs()
-        line = build_batch_line("smoke::L3_02", system_prompt, user_prompt)
-        payload = json.loads(line)
+        payload = build_batch_request("smoke::L3_02", system_prompt, user_prompt)
 
-        print("JSON pretty:")
-        print(json.dumps(payload, indent=2, ensure_ascii=False))
+        if SMOKE_VERBOSE:
+            print("JSON pretty:")
+            print(jsonio.dumps(payload, indent=True).decode("utf-8"))
 
         required_fields = ["custom_id", "method", "url", "body"]
         missing = [field for field in required_fields if field not in payload]
@@ -117,39 +142,50 @@ def test_batch_line() -> None:
 def test_batch_flow() -> None:
     print("\nTeste 3: Fluxo batch minimal")
     try:
-        system_prompt, user_prompt, _response_text = load_inputs()
-        line = build_batch_line("smoke::L3_02", system_prompt, user_prompt)
+        system_prompt, _user_prompt, _response_text = load_inputs()
+        prompts = load_batch_prompts(SMOKE_BATCH_SIZE)
 
         tmp_dir = Path(__file__).resolve().parents[1] / "tmp"
         tmp_dir.mkdir(parents=True, exist_ok=True)
         jsonl_path = tmp_dir / "smoke_batch.jsonl"
-        jsonl_path.write_text(line + "\n", encoding="utf-8")
+        with open(jsonl_path, "wb", buffering=1 << 20) as f:
+            for custom_id, user_prompt in prompts:
+                f.write(build_batch_line(custom_id, system_prompt, user_prompt).encode("utf-8") + b"\n")
 
         file_id = upload_batch_file(str(jsonl_path))
         batch_id = create_batch(file_id)
-        batch = poll_batch(batch_id, interval=BATCH_POLL_INTERVAL)
-
-        output_file_id = batch.output_file_id
-        results = download_batch_results(output_file_id)
-
-        if not results:
-            raise RuntimeError("Nenhum resultado retornado pelo batch")
-
-        first = results[0]
-        verdict = None if first.get("result") is None else first["result"].get("verdict")
-        usage = first.get("usage")
+        batch = poll_batch(
+            batch_id, interval=BATCH_POLL_INTERVAL, max_interval=SMOKE_POLL_MAX_INTERVAL
+        )
 
-        print(f"verdict: {verdict}")
-        print(f"usage: {usage}")
-        print("✅ Teste batch completo OK")
+        # Resultados chegam fora de ordem: casa pelo custom_id
+        pending = {custom_id for custom_id, _ in prompts}
+        for item in stream_batch_results(batch.output_file_id):
+            custom_id = item["custom_id"]
+            if custom_id not in pending:
+                continue
+            pending.discard(custom_id)
+            verdict = None if item.get("result") is None else item["result"].get("verdict")
+            print(f"{custom_id}: verdict={verdict} usage={item.get('usage')}")
+            if not pending:
+                break  # não baixa/parseia o restante do output
+
+        if pending:
+            raise RuntimeError(f"Sem resultado no batch para: {sorted(pending)}")
+
+        print(f"✅ Teste batch completo OK ({len(prompts)} task(s))")
     except Exception as exc:
         print(f"❌ Teste batch completo erro: {exc}")
 
 
 def main() -> None:
-    test_sync_call()
-    test_batch_line()
-    test_batch_flow()
+    # O fluxo batch passa quase todo o tempo em polling: roda em paralelo com os demais
+    load_inputs()  # popula o cache antes das threads
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batch_flow = executor.submit(test_batch_flow)
+        test_sync_call()
+        test_batch_line()
+        batch_flow.result()
 
 
 if __name__ == "__main__":